@@ -0,0 +1,109 @@
+"""
+Benchmark kecil backend kueri dasbor.
+
+Membuat file CSV sintetis untuk setiap jumlah baris, lalu memuat dan mengkueri file itu dengan
+backend pandas dan/atau DuckDB, masing-masing di proses terpisah, dan mencatat waktu serta
+puncak RSS. Backend DuckDB membaca file langsung dari disk (seperti `load_local_csv`), sehingga
+puncak RSS-nya seharusnya tetap datar walaupun file membesar.
+
+Pemakaian: python benchmark_backends.py [jumlah_baris ...] [--backend pandas|duckdb]
+"""
+import argparse
+import io
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_ROWS = [1_000_000]
+GENERATE_CHUNK_ROWS = 250_000
+
+
+def generate_csv(path, rows):
+    """Menulis CSV sintetis dengan kolom yang sama seperti unggahan dasbor, per potongan."""
+    rng = np.random.default_rng(7)
+    words = np.array(["harga", "produk", "baru", "sukses", "gagal", "promo", "kampanye", "viral", "kecewa", "hebat"])
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, rows - start)
+        headlines = pd.Series(words[rng.integers(0, len(words), (n, 6))].tolist()).str.join(" ")
+        pd.DataFrame({
+            "Date": (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")).strftime("%Y-%m-%d"),
+            "Engagements": rng.integers(0, 10_000, n),
+            "Platform": rng.choice(["Instagram", "TikTok", "X", "YouTube", "Facebook"], n),
+            "Sentiment": rng.choice(["Positive", "Negative", "Neutral", None], n),
+            "Media_Type": rng.choice(["Image", "Video", "Text", "Carousel"], n),
+            "Location": rng.choice([f"Kota {i}" for i in range(200)], n),
+            "Headline": headlines,
+        }).to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+def run_backend(name, path):
+    """Memuat CSV dengan backend yang diminta, menjalankan kueri khas dasbor, lalu mencetak hasil."""
+    # Modul dasbor diimpor dalam mode "bare" Streamlit; peringatan konteks diabaikan
+    logging.disable(logging.WARNING)
+    import ryanmiagency as app
+
+    class UploadedFile(io.BytesIO):
+        """Meniru objek file unggahan Streamlit (isi di memori plus ukurannya)."""
+        def __init__(self, data):
+            super().__init__(data)
+            self.size = len(data)
+
+    started = time.perf_counter()
+    if name == "duckdb":
+        # Dibaca per potongan langsung dari disk; file tidak pernah dimuat utuh ke memori
+        with open(path, "rb") as f:
+            backend, _ = app.load_large_csv(f)
+    else:
+        # Backend pandas selalu memegang seluruh file unggahan di memori, seperti di aplikasi
+        with open(path, "rb") as f:
+            uploaded_file = UploadedFile(f.read())
+        backend = app.PandasBackend(app.parse_csv(uploaded_file))
+    loaded = time.perf_counter()
+
+    start_date, end_date = backend.date_range()
+    filters = {'start_date': start_date, 'end_date': end_date, 'platform': "All", 'sentiment': "All",
+               'media_type': "All", 'location': "All", 'unique_stories': False}
+    backend.value_counts(filters, 'Sentiment')
+    backend.engagement_by(filters, 'Platform')
+    backend.engagement_by(filters, 'Location', limit=5)
+    backend.daily_engagement(filters)
+    backend.engagement_quantiles(filters, [0.5, 0.95])
+    backend.story_reach(filters, 5)
+    queried = time.perf_counter()
+    backend.close()
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{name:<8}{loaded - started:>10.1f}{queried - loaded:>10.2f}{peak_rss_mb:>16.0f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("rows", nargs="*", type=int, default=DEFAULT_ROWS, help="jumlah baris per file sintetis")
+    parser.add_argument("--backend", choices=["pandas", "duckdb"], action="append", help="backend yang diukur (bawaan: keduanya)")
+    parser.add_argument("--run", nargs=2, metavar=("BACKEND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_backend(*args.run)
+        return
+
+    script = os.path.abspath(__file__)
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(prefix="media_bench_") as directory:
+            path = os.path.join(directory, "media.csv")
+            generate_csv(path, rows)
+            print(f"\n{rows:,} baris, {os.path.getsize(path) / (1024 * 1024):.0f} MB")
+            print(f"{'backend':<8}{'muat (s)':>10}{'kueri (s)':>10}{'puncak RSS (MB)':>16}", flush=True)
+            # Setiap backend dijalankan di proses baru agar puncak RSS tidak saling memengaruhi
+            for name in args.backend or ["pandas", "duckdb"]:
+                subprocess.run([sys.executable, script, "--run", name, path], check=True, cwd=os.path.dirname(script))
+
+
+if __name__ == "__main__":
+    main()
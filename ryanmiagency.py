@@ -1,12 +1,29 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import google.generativeai as genai
 import io
+import os
+import re
+import shutil
+import tempfile
 import requests
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
 import base64 # Diperlukan untuk mengkodekan gambar ke Base64
 import plotly.io as pio # Diperlukan untuk mengekspor grafik Plotly sebagai gambar
+import pyarrow as pa # Diperlukan untuk ekspor Parquet (sudah terpasang bersama Streamlit)
+import pyarrow.parquet as pq
+
+try:
+    import duckdb # Opsional: backend kueri di disk untuk dataset besar
+except ImportError:
+    duckdb = None
 
 # --- KONFIGURASI HALAMAN & GAYA ---
 # Mengatur konfigurasi halaman. Ini harus menjadi perintah pertama Streamlit.
@@ -37,15 +54,140 @@ def configure_gemini_api():
         st.error(f"Gagal mengkonfigurasi Gemini API: {e}. Pastikan API Key valid.")
         return False
 
-def get_ai_insight(prompt):
+# --- PENJADWAL PERMINTAAN AI ---
+# Semua sesi berbagi satu API key, jadi semua panggilan ke model melewati satu penjadwal
+# global: token bucket sesuai kuota, antrean adil per sesi, dan prioritas.
+GEMINI_REQUESTS_PER_MINUTE = 15
+GEMINI_BURST = 5
+PRIORITY_INTERACTIVE = 0 # Ringkasan, ide konten, penjelasan anomali
+PRIORITY_BATCH = 1       # Wawasan per grafik (dua panggilan per klik)
+DEADLINE_SECONDS = {PRIORITY_INTERACTIVE: 30.0, PRIORITY_BATCH: 120.0}
+
+
+class LLMScheduler:
+    """
+    Penjadwal token bucket dengan antrean adil per sesi.
+    Permintaan dilayani berdasarkan (prioritas, waktu virtual sesi, urutan masuk) sehingga
+    satu sesi yang mengirim banyak permintaan tidak menghabiskan kuota sesi lain.
+    """
+
+    def __init__(self, requests_per_minute, burst):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst)
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._session_clock = {}
+        self._virtual_clock = 0
+        self._seq = 0
+        self._recent_waits = deque(maxlen=50)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _sort_key(self, ticket):
+        return (ticket["priority"], ticket["start"], ticket["seq"])
+
+    def _tickets_ahead(self, priority, start):
+        return sum(1 for t in self._waiting if self._sort_key(t) < (priority, start, self._seq + 1))
+
+    def _estimate_wait(self, priority, start):
+        """Perkiraan waktu tunggu (detik) untuk tiket baru, dihitung dari tiket yang akan dilayani lebih dulu."""
+        missing_tokens = self._tickets_ahead(priority, start) + 1 - self._tokens
+        return max(0.0, missing_tokens / self.rate)
+
+    def estimate(self, session_id, priority):
+        """Mengembalikan (posisi antrean, perkiraan tunggu dalam detik) jika sesi mengirim permintaan sekarang."""
+        with self._cond:
+            self._refill()
+            start = max(self._session_clock.get(session_id, 0), self._virtual_clock)
+            return self._tickets_ahead(priority, start) + 1, self._estimate_wait(priority, start)
+
+    def acquire(self, session_id, priority, deadline):
+        """
+        Menunggu giliran untuk satu panggilan model.
+        Mengembalikan (True, waktu_tunggu) jika diizinkan, atau (False, perkiraan_tunggu) jika
+        perkiraan atau waktu tunggu sebenarnya melebihi tenggat, sehingga permintaan tidak dikirim.
+        """
+        with self._cond:
+            self._refill()
+            # Sesi yang baru aktif mulai dari jam virtual saat ini agar tidak menyalip sesi lain
+            start = max(self._session_clock.get(session_id, 0), self._virtual_clock)
+            estimate = self._estimate_wait(priority, start)
+            if estimate > deadline:
+                return False, estimate
+
+            self._seq += 1
+            ticket = {"session": session_id, "priority": priority, "start": start,
+                      "seq": self._seq, "enqueued": time.monotonic()}
+            self._waiting.append(ticket)
+            self._session_clock[session_id] = start + 1
+
+            while True:
+                self._refill()
+                waited = time.monotonic() - ticket["enqueued"]
+                if min(self._waiting, key=self._sort_key) is ticket and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._waiting.remove(ticket)
+                    self._virtual_clock = max(self._virtual_clock, ticket["start"])
+                    self._recent_waits.append(waited)
+                    self._cond.notify_all()
+                    return True, waited
+                if waited > deadline:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+                    return False, waited
+                next_token = max(0.0, (1 - self._tokens) / self.rate)
+                self._cond.wait(timeout=min(next_token, deadline - waited) + 0.01)
+
+    def status(self):
+        """Mengembalikan kedalaman antrean dan rata-rata waktu tunggu terakhir (detik)."""
+        with self._cond:
+            self._refill()
+            avg_wait = sum(self._recent_waits) / len(self._recent_waits) if self._recent_waits else 0.0
+            return {
+                "depth": len(self._waiting),
+                "avg_wait": avg_wait,
+                "next_wait": self._estimate_wait(PRIORITY_BATCH, float("inf")),
+            }
+
+
+@st.cache_resource
+def get_llm_scheduler():
+    """Satu instance penjadwal untuk seluruh proses, dipakai bersama oleh semua sesi."""
+    return LLMScheduler(GEMINI_REQUESTS_PER_MINUTE, GEMINI_BURST)
+
+
+def get_session_id():
+    """ID acak per sesi browser, dipakai penjadwal untuk antrean adil."""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def get_ai_insight(prompt, priority=PRIORITY_INTERACTIVE):
     """
     Memanggil API Gemini untuk menghasilkan wawasan berdasarkan prompt yang diberikan.
-    Menggunakan model 'gemini-2.0-flash'.
+    Menggunakan model 'gemini-2.0-flash'. Setiap panggilan menunggu giliran di penjadwal global.
     """
     # Pastikan API sudah dikonfigurasi melalui configure_gemini_api()
     if not configure_gemini_api(): # Memanggil lagi untuk memastikan konfigurasi sebelum setiap request
         return "Gagal membuat wawasan: API tidak terkonfigurasi."
 
+    deadline = DEADLINE_SECONDS[priority]
+    scheduler = get_llm_scheduler()
+    position, estimate = scheduler.estimate(get_session_id(), priority)
+    # Tampilkan posisi dan perkiraan tunggu selama permintaan tertahan di antrean
+    with st.spinner(f"Menunggu giliran di antrean AI: posisi {position}, perkiraan tunggu {estimate:.0f} detik "
+                    f"({scheduler.status()['depth']} permintaan dalam antrean)..."):
+        granted, wait = scheduler.acquire(get_session_id(), priority, deadline)
+    if not granted:
+        return (f"Gagal membuat wawasan: antrean AI sedang penuh (perkiraan tunggu {wait:.0f} detik, "
+                f"batas {deadline:.0f} detik). Silakan coba lagi sebentar lagi.")
+
     try:
         model = genai.GenerativeModel('gemini-2.0-flash')
         response = model.generate_content(prompt)
@@ -365,39 +507,1091 @@ def load_css():
         </style>
     """, unsafe_allow_html=True)
 
+# Kolom teks yang selalu tersedia setelah pembersihan, dan kolom yang dipakai oleh backend kueri
+REQUIRED_TEXT_COLUMNS = ['Platform', 'Sentiment', 'Media Type', 'Location', 'Headline']
+DATASET_COLUMNS = ['Date', 'Engagements'] + REQUIRED_TEXT_COLUMNS + ['Sentiment Inferred', 'Story Cluster']
+
+# --- SKOR SENTIMEN LOKAL ---
+# Model linear sederhana di atas fitur n-gram (unigram & bigram) yang di-hash.
+# Bobot bigram dipakai untuk menangani negasi, mis. "tidak baik" membalik "baik".
+SENTIMENT_HASH_BUCKETS = 2 ** 18
+SENTIMENT_CHUNK_SIZE = 250_000
+SENTIMENT_CACHE_MAX_ENTRIES = 200_000 # ~20 MB per proses server; skor ulang judul lama murah
+SENTIMENT_NEUTRAL_MARGIN = 0.5
+SENTIMENT_LEXICON = {
+    # Positif (Indonesia & Inggris)
+    "baik": 1.0, "bagus": 1.0, "hebat": 1.5, "sukses": 1.5, "berhasil": 1.5, "meningkat": 1.0,
+    "naik": 0.5, "untung": 1.0, "positif": 1.0, "puas": 1.0, "senang": 1.0, "terbaik": 1.5,
+    "juara": 1.5, "inovasi": 1.0, "inovatif": 1.0, "prestasi": 1.5, "apresiasi": 1.0, "dukung": 0.5,
+    "dukungan": 0.5, "tumbuh": 1.0, "pertumbuhan": 1.0, "rekor": 1.0, "menang": 1.5, "aman": 0.5,
+    "good": 1.0, "great": 1.5, "success": 1.5, "win": 1.5, "wins": 1.5, "growth": 1.0, "best": 1.5,
+    "record": 1.0, "launch": 0.5, "improve": 1.0, "improved": 1.0, "positive": 1.0, "award": 1.5,
+    "strong": 1.0, "boost": 1.0, "surge": 1.0, "love": 1.5, "excellent": 2.0, "profit": 1.0,
+    # Negatif (Indonesia & Inggris)
+    "buruk": -1.5, "gagal": -1.5, "rugi": -1.5, "turun": -1.0, "anjlok": -1.5, "krisis": -1.5,
+    "masalah": -1.0, "kecewa": -1.5, "keluhan": -1.0, "protes": -1.0, "skandal": -2.0, "korupsi": -2.0,
+    "penipuan": -2.0, "bocor": -1.5, "kebocoran": -1.5, "boikot": -1.5, "kecelakaan": -1.5,
+    "gangguan": -1.0, "lambat": -0.5, "mahal": -0.5, "negatif": -1.0, "ancaman": -1.0, "tuntutan": -1.0,
+    "bad": -1.5, "fail": -1.5, "failure": -1.5, "loss": -1.5, "drop": -1.0, "decline": -1.0,
+    "crisis": -1.5, "scandal": -2.0, "fraud": -2.0, "lawsuit": -1.5, "complaint": -1.0, "boycott": -1.5,
+    "outage": -1.0, "breach": -1.5, "recall": -1.0, "negative": -1.0, "worst": -2.0, "hate": -1.5,
+    # Bigram negasi
+    "tidak baik": -2.0, "tidak bagus": -2.0, "tidak puas": -2.0, "kurang baik": -2.0,
+    "tidak berhasil": -3.0, "belum berhasil": -2.5, "tidak aman": -1.5, "tidak gagal": 2.5,
+    "not good": -2.0, "not bad": 2.5, "no problem": 2.0, "tanpa masalah": 2.0,
+}
+
+
+def _hash_ngrams(ngrams):
+    """Memetakan array n-gram (string) ke indeks bucket fitur secara tervektorisasi."""
+    hashed = pd.util.hash_array(np.asarray(ngrams, dtype=object), categorize=False)
+    return (hashed % SENTIMENT_HASH_BUCKETS).astype(np.int64)
+
+
+@st.cache_resource
+def get_sentiment_model():
+    """
+    Membangun vektor bobot hash dari leksikon dan cache label per hash judul.
+    Disimpan sebagai resource agar dipakai bersama oleh semua sesi dan rerun; akses ke cache
+    dilindungi `lock` karena beberapa sesi dapat mengunggah file secara bersamaan.
+    """
+    weights = np.zeros(SENTIMENT_HASH_BUCKETS, dtype=np.float32)
+    np.add.at(
+        weights,
+        _hash_ngrams(list(SENTIMENT_LEXICON.keys())),
+        np.fromiter(SENTIMENT_LEXICON.values(), dtype=np.float32),
+    )
+    return {"weights": weights, "cache": {}, "lock": threading.Lock()}
+
+
+def score_headlines(headlines, weights):
+    """
+    Menghitung label sentimen untuk array judul unik.
+    Seluruh langkah (tokenisasi, pembentukan bigram, hashing, penjumlahan bobot) dilakukan per kolom, bukan per baris.
+    """
+    tokens = pd.Series(headlines, dtype=object).str.lower().str.findall(r"\w+").explode().dropna()
+    row_ids = tokens.index.to_numpy()
+    token_values = tokens.to_numpy(dtype=object)
+
+    # Bigram dibentuk dari token berurutan yang berasal dari judul yang sama
+    same_row = row_ids[:-1] == row_ids[1:]
+    bigrams = tokens.iloc[:-1][same_row] + " " + tokens.iloc[1:].to_numpy()[same_row]
+
+    all_ids = np.concatenate([row_ids, row_ids[:-1][same_row]]).astype(np.int64)
+    all_ngrams = np.concatenate([token_values, bigrams.to_numpy(dtype=object)])
+    scores = np.bincount(all_ids, weights=weights[_hash_ngrams(all_ngrams)], minlength=len(headlines))
+
+    return np.select(
+        [scores > SENTIMENT_NEUTRAL_MARGIN, scores < -SENTIMENT_NEUTRAL_MARGIN],
+        ["Positive", "Negative"],
+        default="Neutral",
+    )
+
+
+def backfill_sentiment(df):
+    """
+    Mengisi nilai 'Sentiment' yang kosong ('N/A') dengan hasil skor lokal dari 'Headline'.
+    Baris yang diisi ditandai pada kolom 'Sentiment Inferred'. Label disimpan per hash judul
+    sehingga judul yang sama (termasuk dari unggahan lain) tidak dihitung ulang.
+    """
+    df['Sentiment Inferred'] = False
+    missing = (df['Sentiment'] == 'N/A') & (df['Headline'] != 'N/A')
+    if not missing.any():
+        return df
+
+    model = get_sentiment_model()
+    cache = model["cache"]
+
+    headlines = df.loc[missing, 'Headline'].astype(str).to_numpy(dtype=object)
+    codes, unique_hashes = pd.factorize(pd.util.hash_array(headlines))
+    unique_hashes = unique_hashes.tolist()
+    # Hanya hash unik potongan ini yang dicari di cache, sehingga waktu di dalam lock tidak
+    # bergantung pada ukuran cache. Sesi lain yang mengosongkan cache setelah ini tidak memengaruhi hasil.
+    with model["lock"]:
+        labels = np.array([cache.get(h) for h in unique_hashes], dtype=object)
+    unknown = np.flatnonzero(pd.isna(labels))
+
+    if unknown.size:
+        # Ambil satu judul per hash, lalu skor dalam potongan besar agar memori tetap terkendali
+        first_rows = np.unique(codes, return_index=True)[1]
+        for start in range(0, unknown.size, SENTIMENT_CHUNK_SIZE):
+            positions = unknown[start:start + SENTIMENT_CHUNK_SIZE]
+            labels[positions] = score_headlines(headlines[first_rows[positions]], model["weights"])
+        scored = dict(zip([unique_hashes[i] for i in unknown.tolist()], labels[unknown].tolist()))
+        with model["lock"]:
+            if len(cache) + len(scored) > SENTIMENT_CACHE_MAX_ENTRIES:
+                cache.clear()
+            cache.update(scored)
+
+    df.loc[missing, 'Sentiment'] = labels[codes]
+    df.loc[missing, 'Sentiment Inferred'] = True
+    return df
+
+
+def clean_media_frame(df):
+    """Membersihkan DataFrame mentah (atau satu potongannya) ke skema yang dipakai dasbor."""
+    # --- PERBAIKAN: Mengganti nama kolom 'Media_Type' menjadi 'Media Type' ---
+    if 'Media_Type' in df.columns:
+        df.rename(columns={'Media_Type': 'Media Type'}, inplace=True)
+    # ----------------------------------------------------------------------
+
+    # Pembersihan data
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df['Engagements'] = pd.to_numeric(df['Engagements'], errors='coerce')
+    df.dropna(subset=['Date', 'Engagements'], inplace=True)
+    df['Engagements'] = df['Engagements'].astype(int)
+
+    # Memastikan kolom lain ada
+    for col in REQUIRED_TEXT_COLUMNS:
+        if col not in df.columns:
+            df[col] = 'N/A' # Isi dengan N/A jika tidak ada
+    # Nilai teks dipaksa menjadi string agar tipe kolom sama di kedua backend, antar potongan dan di ekspor Parquet
+    df[REQUIRED_TEXT_COLUMNS] = df[REQUIRED_TEXT_COLUMNS].fillna('N/A').astype(str)
+
+    # Mengisi sentimen yang hilang secara lokal (tanpa akses jaringan)
+    return backfill_sentiment(df)
+
+
 @st.cache_data
 def parse_csv(uploaded_file):
     """Membaca file CSV yang diunggah ke dalam DataFrame pandas dan membersihkannya."""
     try:
         string_data = uploaded_file.getvalue().decode("utf-8")
         df = pd.read_csv(io.StringIO(string_data))
-        
-        # --- PERBAIKAN: Mengganti nama kolom 'Media_Type' menjadi 'Media Type' ---
-        if 'Media_Type' in df.columns:
-            df.rename(columns={'Media_Type': 'Media Type'}, inplace=True)
-        # ----------------------------------------------------------------------
-        
-        # Pembersihan data
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df['Engagements'] = pd.to_numeric(df['Engagements'], errors='coerce')
-        df.dropna(subset=['Date', 'Engagements'], inplace=True)
-        df['Engagements'] = df['Engagements'].astype(int)
-        
-        # Memastikan kolom lain ada
-        required_cols = ['Platform', 'Sentiment', 'Media Type', 'Location', 'Headline']
-        for col in required_cols:
-            if col not in df.columns:
-                df[col] = 'N/A' # Isi dengan N/A jika tidak ada
-        df[required_cols] = df[required_cols].fillna('N/A')
-
-        return df
+        return assign_story_clusters(clean_media_frame(df))
     except Exception as e:
         st.error(f"Gagal memproses file CSV. Pastikan formatnya benar. Error: {e}")
         return None
 
+# --- DETEKSI CERITA SINDIKASI (MINHASH LSH) ---
+# Judul yang hampir sama (berita yang sama dari banyak media) dikelompokkan ke satu cerita.
+# Tanda tangan MinHash dihitung atas shingle dua kata berurutan per judul (tanpa stopword), lalu
+# dibagi ke beberapa band; judul yang berbagi satu band menjadi kandidat (ambang Jaccard ≈ (1/b)^(1/r)).
+# Setiap kandidat diverifikasi dengan perkiraan Jaccard dari tanda tangan sebelum digabung
+# lewat union-find. Agar cerita tidak merambat lewat rantai judul, setiap anggota juga harus lolos
+# ambang terhadap akar ceritanya. Id cerita = baris pertama dari judul terawal di cerita tersebut,
+# sehingga hasil pandas (satu lintasan) dan DuckDB (berpotongan) identik.
+MINHASH_BANDS = 16
+MINHASH_ROWS_PER_BAND = 6 # Ambang kandidat ≈ 0,63
+STORY_JACCARD_THRESHOLD = 0.6
+STORY_MAX_ROUNDS = 3 # Putaran pengelompokan ulang untuk anggota yang gagal terhadap akar ceritanya
+STORY_VERIFY_BATCH = 50_000 # Pasangan per irisan verifikasi (~77 MB tanda tangan per irisan)
+_MINHASH_SEEDS = np.random.default_rng(20240601).integers(0, 2 ** 63, MINHASH_BANDS * MINHASH_ROWS_PER_BAND, dtype=np.uint64)
+_MINHASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_STORY_MIN_MATCHES = int(np.ceil(STORY_JACCARD_THRESHOLD * _MINHASH_SEEDS.size))
+# Kata umum (Indonesia & Inggris) tidak ikut dihitung agar judul pendek tidak saling cocok karenanya
+STORY_STOPWORDS = frozenset("""
+    yang dan di ke dari untuk dengan pada ini itu dalam akan tidak juga ada adalah oleh atau
+    karena sebagai bisa saat sudah telah bagi para hingga agar serta lebih baru kata usai jadi
+    the a an and or of to in on for with at by from is are was were be as it its this that
+    after new says over about into up out not no
+""".split())
+
+
+def _minhash_signatures(headlines):
+    """
+    Menghitung tanda tangan MinHash untuk array judul unik.
+    Mengembalikan (posisi judul yang memiliki token, matriks tanda tangan [n_judul x hash]).
+    """
+    tokens = pd.Series(headlines, dtype=object).str.lower().str.findall(r"\w+").explode().dropna()
+    tokens = tokens[~tokens.isin(STORY_STOPWORDS)]
+    if tokens.empty:
+        return np.empty(0, dtype=np.int64), np.empty((0, _MINHASH_SEEDS.size), dtype=np.uint64)
+    token_rows = tokens.index.to_numpy()
+    token_hashes = pd.util.hash_array(tokens.to_numpy(dtype=object), categorize=False)
+
+    # Shingle = pasangan kata berurutan dalam judul yang sama; judul satu kata memakai kata itu sendiri
+    same_headline = token_rows[1:] == token_rows[:-1]
+    single_word = np.bincount(token_rows)[token_rows] == 1
+    row_ids = np.concatenate([token_rows[:-1][same_headline], token_rows[single_word]])
+    shingle_hashes = np.concatenate([(token_hashes[:-1] * _MINHASH_MULTIPLIER ^ token_hashes[1:])[same_headline], token_hashes[single_word]])
+    order = np.argsort(row_ids, kind='stable')
+    row_ids, shingle_hashes = row_ids[order], shingle_hashes[order]
+
+    # Shingle sudah berurutan per judul, jadi minimum per judul bisa dihitung dengan reduceat
+    starts = np.flatnonzero(np.r_[True, row_ids[1:] != row_ids[:-1]])
+    signatures = np.empty((starts.size, _MINHASH_SEEDS.size), dtype=np.uint64)
+    for i, seed in enumerate(_MINHASH_SEEDS):
+        permuted = (shingle_hashes ^ seed) * _MINHASH_MULTIPLIER
+        permuted ^= permuted >> np.uint64(29)
+        signatures[:, i] = np.minimum.reduceat(permuted, starts)
+    return row_ids[starts], signatures
+
+
+def _minhash_band_keys(signatures):
+    """Meringkas setiap band tanda tangan menjadi satu kunci hash [n_judul x band]."""
+    return np.column_stack([
+        pd.util.hash_pandas_object(
+            pd.DataFrame(signatures[:, band * MINHASH_ROWS_PER_BAND:(band + 1) * MINHASH_ROWS_PER_BAND]), index=False
+        ).to_numpy()
+        for band in range(MINHASH_BANDS)
+    ])
+
+
+def _connected_components(u, v):
+    """
+    Union-find tervektorisasi atas sisi (u, v): akar dikaitkan ke akar yang lebih kecil lalu
+    jalur dipendekkan hingga stabil. Mengembalikan (simpul, id terkecil di komponennya).
+    """
+    nodes = np.unique(np.concatenate([u, v]))
+    u, v = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+    parent = np.arange(nodes.size)
+    while True:
+        root_u, root_v = parent[u], parent[v]
+        pending = root_u != root_v
+        if not pending.any():
+            return nodes, nodes[parent]
+        np.minimum.at(parent, np.maximum(root_u, root_v)[pending], np.minimum(root_u, root_v)[pending])
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def _signature_matches(signatures, a, b):
+    """Apakah perkiraan Jaccard pasangan baris tanda tangan (a, b) lolos ambang; dihitung per irisan."""
+    passed = np.empty(a.size, dtype=bool)
+    for start in range(0, a.size, STORY_VERIFY_BATCH):
+        part = slice(start, start + STORY_VERIFY_BATCH)
+        passed[part] = (signatures[a[part]] == signatures[b[part]]).sum(axis=1) >= _STORY_MIN_MATCHES
+    return passed
+
+
+def _story_members(u, v, matches_root):
+    """
+    Menggabungkan pasangan terverifikasi (u, v) menjadi cerita. Anggota komponen hanya masuk ke
+    cerita akarnya (judul terawal) jika `matches_root(anggota, akar)` lolos; anggota yang gagal
+    dikelompokkan ulang di antara sesamanya, paling banyak STORY_MAX_ROUNDS putaran, dan sisanya
+    menjadi cerita sendiri. Mengembalikan (id judul, id cerita) untuk judul yang bergabung.
+    """
+    members, clusters = [], []
+    for _ in range(STORY_MAX_ROUNDS):
+        if u.size == 0:
+            break
+        nodes, roots = _connected_components(u, v)
+        candidates = nodes != roots
+        passed = np.zeros(nodes.size, dtype=bool)
+        passed[candidates] = matches_root(nodes[candidates], roots[candidates])
+        members.append(nodes[passed])
+        clusters.append(roots[passed])
+        rejected = nodes[candidates & ~passed]
+        remaining = np.isin(u, rejected) & np.isin(v, rejected)
+        u, v = u[remaining], v[remaining]
+    if not members:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(members), np.concatenate(clusters)
+
+
+def assign_story_clusters(df):
+    """
+    Memberi setiap baris id cerita ('Story Cluster') dalam satu lintasan di memori.
+    Kandidat per band dipasangkan dengan judul terawal yang berbagi kunci band tersebut, lalu
+    hanya pasangan dengan perkiraan Jaccard di atas ambang yang digabung (lihat `_story_members`).
+    Baris tanpa judul menjadi cerita tersendiri.
+    """
+    row_numbers = df.index.to_numpy()
+    clusters = row_numbers.copy()
+    has_headline = (df['Headline'] != 'N/A').to_numpy()
+    codes, unique_headlines = pd.factorize(df.loc[has_headline, 'Headline'].astype(str))
+    # Id judul = baris pertama kemunculannya (factorize mempertahankan urutan kemunculan)
+    headline_ids = row_numbers[has_headline][np.unique(codes, return_index=True)[1]]
+    headline_clusters = headline_ids.copy()
+
+    positions, signatures = _minhash_signatures(unique_headlines.to_numpy(dtype=object))
+    if positions.size:
+        ids = headline_ids[positions]
+        band_keys = _minhash_band_keys(signatures)
+        pairs = pd.concat([
+            pd.DataFrame({'a': np.arange(positions.size), 'b': pd.Series(ids).groupby(band_keys[:, band]).transform('idxmin').to_numpy()})
+            for band in range(MINHASH_BANDS)
+        ]).drop_duplicates()
+        pairs = pairs[pairs['a'] != pairs['b']]
+        a, b = pairs['a'].to_numpy(), pairs['b'].to_numpy()
+        verified = _signature_matches(signatures, a, b)
+        signature_rows = pd.Index(ids)
+        merged, roots = _story_members(
+            ids[a[verified]], ids[b[verified]],
+            lambda members, roots: _signature_matches(signatures, signature_rows.get_indexer(members), signature_rows.get_indexer(roots)),
+        )
+        headline_clusters[pd.Index(headline_ids).get_indexer(merged)] = roots
+
+    clusters[has_headline] = headline_clusters[codes]
+    df['Story Cluster'] = clusters
+    return df
+
+
+def add_story_headlines(con, chunk):
+    """
+    Menyimpan judul yang baru muncul di potongan ini beserta tanda tangan dan kunci band-nya ke
+    tabel DuckDB `story_headlines`, sehingga indeks LSH berada di disk, bukan di memori.
+    """
+    con.execute(
+        'CREATE TABLE IF NOT EXISTS story_headlines (id BIGINT, "Headline" VARCHAR, '
+        + ", ".join([f"s{i} UBIGINT" for i in range(_MINHASH_SEEDS.size)] + [f"b{band} UBIGINT" for band in range(MINHASH_BANDS)])
+        + ")"
+    )
+    headlines = chunk.loc[chunk['Headline'] != 'N/A', 'Headline'].astype(str)
+    first_rows = headlines.rename_axis('id').reset_index().drop_duplicates('Headline')
+    con.register('chunk_headlines', first_rows)
+    new = con.execute('SELECT id, "Headline" FROM chunk_headlines ANTI JOIN story_headlines USING ("Headline")').df()
+    con.unregister('chunk_headlines')
+
+    positions, signatures = _minhash_signatures(new['Headline'].to_numpy(dtype=object))
+    batch = pd.concat([
+        new.iloc[positions].reset_index(drop=True),
+        pd.DataFrame(signatures, columns=[f"s{i}" for i in range(signatures.shape[1])]),
+        pd.DataFrame(_minhash_band_keys(signatures) if positions.size else np.empty((0, MINHASH_BANDS), dtype=np.uint64),
+                     columns=[f"b{band}" for band in range(MINHASH_BANDS)]),
+    ], axis=1)
+    # Judul tanpa token tetap disimpan (tanda tangan NULL) agar tidak diproses ulang di potongan berikutnya
+    without_tokens = new.drop(index=positions)
+    for frame in (batch, without_tokens):
+        con.register('batch', frame)
+        con.execute("INSERT INTO story_headlines BY NAME SELECT * FROM batch")
+        con.unregister('batch')
+
+
+def _stored_signature_matches(con, a, b):
+    """
+    Seperti `_signature_matches` untuk pasangan id judul (a, b), tetapi tanda tangan diambil dari
+    tabel `story_headlines` per irisan lewat semi-join, sehingga hanya satu irisan ada di memori.
+    """
+    signature_columns = ", ".join(f"s{i}" for i in range(_MINHASH_SEEDS.size))
+    passed = np.empty(a.size, dtype=bool)
+    for start in range(0, a.size, STORY_VERIFY_BATCH):
+        part_a, part_b = a[start:start + STORY_VERIFY_BATCH], b[start:start + STORY_VERIFY_BATCH]
+        con.register('verify_ids', pd.DataFrame({'id': np.unique(np.concatenate([part_a, part_b]))}))
+        rows = con.execute(
+            f"SELECT id, {signature_columns} FROM story_headlines WHERE id IN (SELECT id FROM verify_ids)"
+        ).fetchnumpy()
+        con.unregister('verify_ids')
+        signature_rows = pd.Index(rows['id'])
+        signatures = np.column_stack([rows[f"s{i}"] for i in range(_MINHASH_SEEDS.size)])
+        passed[start:start + STORY_VERIFY_BATCH] = _signature_matches(
+            signatures, signature_rows.get_indexer(part_a), signature_rows.get_indexer(part_b))
+    return passed
+
+
+def cluster_stories(con):
+    """
+    Lintasan kedua setelah semua potongan dimuat: pasangan kandidat per band dicari di DuckDB,
+    diverifikasi per irisan, digabung dengan `_story_members`, lalu kolom 'Story Cluster' tabel
+    media diisi. Aturannya sama dengan `assign_story_clusters` sehingga hasilnya identik.
+    """
+    bands = " UNION ALL ".join(
+        f"SELECT id, {band} AS band, b{band} AS key FROM story_headlines WHERE b{band} IS NOT NULL" for band in range(MINHASH_BANDS)
+    )
+    pairs = con.execute(f"""
+        WITH bands AS ({bands}),
+        representatives AS (SELECT band, key, MIN(id) AS rep FROM bands GROUP BY band, key HAVING COUNT(*) > 1)
+        SELECT DISTINCT bands.id, representatives.rep FROM bands JOIN representatives USING (band, key)
+        WHERE bands.id <> representatives.rep
+    """).df()
+    pair_ids, pair_reps = pairs['id'].to_numpy(dtype=np.int64), pairs['rep'].to_numpy(dtype=np.int64)
+    verified = _stored_signature_matches(con, pair_ids, pair_reps)
+    nodes, roots = _story_members(
+        pair_ids[verified], pair_reps[verified], lambda members, roots: _stored_signature_matches(con, members, roots)
+    )
+    con.register('components', pd.DataFrame({'id': nodes, 'cluster': roots}))
+    con.execute(
+        'UPDATE media SET "Story Cluster" = s.cluster FROM ('
+        'SELECT h."Headline", COALESCE(c.cluster, h.id) AS cluster FROM story_headlines h LEFT JOIN components c USING (id)'
+        ') s WHERE media."Headline" = s."Headline"'
+    )
+    con.unregister('components')
+    # Baris tanpa judul menjadi cerita tersendiri, sama seperti di backend pandas
+    con.execute('UPDATE media SET "Story Cluster" = _row WHERE "Story Cluster" IS NULL')
+    con.execute("DROP TABLE story_headlines")
+
+# --- MODE ANALITIK PERKIRAAN (SKETSA) ---
+# Kubus sketsa per sel (Tanggal, Platform, Sentiment, Media Type), dibangun dalam satu kali
+# lintasan berpotongan saat file besar diunggah. Setiap sel menyimpan sketsa yang dapat digabung:
+# HyperLogLog (jumlah unik), Misra-Gries (heavy hitters) dan t-digest (kuantil). Semua sketsa
+# disimpan sebagai tabel per sel sehingga setiap potongan diproses secara tervektorisasi. Register
+# HyperLogLog disimpan jarang (hanya yang terisi), karena sebagian besar sel hanya berisi sedikit baris.
+APPROX_MIN_ROWS = 500_000 # Di bawah ini agregasi eksak sudah cukup cepat, kubus tidak dibangun
+APPROX_CHUNK_ROWS = 500_000
+APPROX_HLL_PRECISION = 10 # 1024 register per sketsa, galat relatif ~3,3%
+APPROX_HEAVY_HITTERS_K = 64
+APPROX_TDIGEST_DELTA = 100
+CUBE_DIMENSIONS = ['Date', 'Platform', 'Sentiment', 'Media Type']
+CUBE_HLL_FIELDS = {"hll_headline": 'Headline', "hll_location": 'Location', "hll_story": 'Story Cluster'}
+CUBE_HEAVY_HITTER_FIELDS = {"top_locations": 'Location', "top_headlines": 'Headline'}
+
+
+def _hll_update(registers, cells, hashes):
+    """
+    Menggabungkan hash uint64 per baris ke register HyperLogLog jarang: Series rank (uint8)
+    berindeks `sel << presisi | indeks register`. Mengembalikan Series register yang baru.
+    """
+    p = APPROX_HLL_PRECISION
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    # 32 bit teratas setelah bit indeks cukup untuk rank hingga 33 dan tepat direpresentasikan float64
+    rest = ((hashes << np.uint64(p)) >> np.uint64(32)).astype(np.float64)
+    rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+    updates = pd.Series(rank, index=(cells.astype(np.int64) << p) | index)
+    return pd.concat([registers, updates]).groupby(level=0).max()
+
+
+def _hll_registers(registers, positions):
+    """Menggabungkan register jarang dari sel-sel di `positions` menjadi satu sketsa padat."""
+    p = APPROX_HLL_PRECISION
+    keys = registers.index.to_numpy()
+    selected = np.isin(keys >> p, positions)
+    merged = np.zeros(1 << p, dtype=np.uint8)
+    np.maximum.at(merged, keys[selected] & ((1 << p) - 1), registers.to_numpy()[selected])
+    return merged
+
+
+def _hll_estimate(registers):
+    """Mengembalikan (perkiraan jumlah unik, batas galat ~95%) dari register HyperLogLog."""
+    m = registers.size
+    zeros = int(np.count_nonzero(registers == 0))
+    if zeros == m:
+        return 0, 0
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -registers.astype(np.float64))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros) # Koreksi untuk kardinalitas kecil (linear counting)
+    return int(round(estimate)), int(np.ceil(2 * 1.04 / np.sqrt(m) * estimate))
+
+
+def _heavy_hitters_update(counters, errors, batch):
+    """
+    Menggabungkan ringkasan Misra-Gries per sel (`counters`: tabel cell/key/weight) dengan `batch`
+    (tabel yang sama), lalu memangkas setiap sel menjadi paling banyak K penghitung.
+    Untuk setiap sel, nilai sebenarnya berada di [estimasi, estimasi + errors[sel]].
+    """
+    merged = pd.concat([counters, batch]).groupby(['cell', 'key'], sort=False)['weight'].sum().reset_index()
+    merged = merged.sort_values(['cell', 'weight'], ascending=[True, False], ignore_index=True)
+    rank = merged.groupby('cell').cumcount().to_numpy()
+    kth = merged.loc[rank == APPROX_HEAVY_HITTERS_K].set_index('cell')['weight']
+    if kth.empty:
+        return merged, errors
+    cell_kth = merged['cell'].map(kth).fillna(0).to_numpy()
+    merged['weight'] = merged['weight'] - cell_kth
+    np.add.at(errors, kth.index.to_numpy(), kth.to_numpy())
+    return merged[merged['weight'] > 0].reset_index(drop=True), errors
+
+
+def _tdigest_compress(centroids):
+    """
+    Memampatkan centroid t-digest (tabel cell/mean/weight) per sel dengan fungsi skala k1 (arcsin).
+    Semua sel dimampatkan sekaligus secara tervektorisasi.
+    """
+    centroids = centroids.sort_values(['cell', 'mean'], kind='stable', ignore_index=True)
+    weights = centroids['weight'].to_numpy()
+    by_cell = centroids.groupby('cell')['weight']
+    q_mid = (by_cell.cumsum().to_numpy() - weights / 2) / by_cell.transform('sum').to_numpy()
+    k = np.floor(APPROX_TDIGEST_DELTA / (2 * np.pi) * (np.arcsin(np.clip(2 * q_mid - 1, -1, 1)) + np.pi / 2))
+    merged = centroids.assign(k=k, weighted=centroids['mean'] * weights).groupby(['cell', 'k'], sort=False).agg(
+        weight=('weight', 'sum'), weighted=('weighted', 'sum')).reset_index()
+    return pd.DataFrame({'cell': merged['cell'], 'mean': merged['weighted'] / merged['weight'], 'weight': merged['weight']})
+
+
+def _tdigest_quantile(means, weights, q):
+    """Mengembalikan (nilai kuantil, batas bawah, batas atas) dari centroid t-digest yang terurut."""
+    if means.size == 0:
+        return np.nan, np.nan, np.nan
+    cum_q = (np.cumsum(weights) - weights / 2) / weights.sum()
+    # Satu centroid mencakup paling banyak Δq ≈ 2π·sqrt(q(1-q))/δ dari distribusi
+    span = 2 * np.pi * np.sqrt(q * (1 - q)) / APPROX_TDIGEST_DELTA
+    value, low, high = np.interp([q, max(0.0, q - span), min(1.0, q + span)], cum_q, means)
+    return value, low, high
+
+
+def new_sketch_cube():
+    """Kubus sketsa kosong; sel diberi id berurutan sesuai kemunculan pertama."""
+    cube = {
+        "cell_ids": {},
+        "totals": pd.DataFrame({'count': [], 'Engagements': [], 'inferred': []}, dtype=np.int64),
+        "digest": pd.DataFrame({'cell': np.zeros(0, dtype=np.int64), 'mean': np.zeros(0), 'weight': np.zeros(0)}),
+    }
+    for field in CUBE_HLL_FIELDS:
+        cube[field] = pd.Series(dtype=np.uint8, index=pd.Index([], dtype=np.int64))
+    for field in CUBE_HEAVY_HITTER_FIELDS:
+        cube[field] = pd.DataFrame({'cell': np.zeros(0, dtype=np.int64), 'key': pd.Series(dtype=object), 'weight': np.zeros(0)})
+        cube[f"{field}_error"] = np.zeros(0)
+    return cube
+
+
+def _sketch_cells(cube, chunk):
+    """Memetakan setiap baris potongan ke id sel kubus, memperbesar array per sel untuk sel baru."""
+    keys = pd.MultiIndex.from_arrays([chunk['Date'].dt.date, chunk['Platform'], chunk['Sentiment'], chunk['Media Type']])
+    codes, unique_keys = pd.factorize(keys)
+    cell_ids = cube["cell_ids"]
+    chunk_ids = np.fromiter((cell_ids.setdefault(key, len(cell_ids)) for key in unique_keys), dtype=np.int64, count=len(unique_keys))
+    cells = chunk_ids[codes]
+
+    # Perbesar array per sel untuk sel yang baru muncul
+    n_cells = len(cell_ids)
+    grow = n_cells - len(cube["totals"])
+    if grow:
+        cube["totals"] = pd.concat([cube["totals"], pd.DataFrame(0, index=range(grow), columns=cube["totals"].columns)], ignore_index=True)
+        for field in CUBE_HEAVY_HITTER_FIELDS:
+            cube[f"{field}_error"] = np.concatenate([cube[f"{field}_error"], np.zeros(grow)])
+    return cells
+
+
+def update_sketch_cube(cube, chunk):
+    """Menambahkan satu potongan baris yang sudah dibersihkan ke kubus sketsa (tanpa perulangan per sel)."""
+    cells = _sketch_cells(cube, chunk)
+    n_cells = len(cube["cell_ids"])
+    engagements = chunk['Engagements'].to_numpy(dtype=np.float64)
+    cube["totals"] += pd.DataFrame({
+        'count': np.bincount(cells, minlength=n_cells),
+        'Engagements': np.bincount(cells, weights=engagements, minlength=n_cells).astype(np.int64),
+        'inferred': np.bincount(cells, weights=chunk['Sentiment Inferred'].to_numpy(dtype=np.float64), minlength=n_cells).astype(np.int64),
+    })
+    for field, column in CUBE_HLL_FIELDS.items():
+        values = chunk[column].to_numpy() if column == 'Story Cluster' else chunk[column].astype(str).to_numpy(dtype=object)
+        cube[field] = _hll_update(cube[field], cells, pd.util.hash_array(values))
+
+    # Lokasi diberi bobot keterlibatan, judul diberi bobot jumlah sebutan
+    for field, column in CUBE_HEAVY_HITTER_FIELDS.items():
+        weights = engagements if field == "top_locations" else np.ones(len(chunk))
+        batch = pd.DataFrame({'cell': cells, 'key': chunk[column].to_numpy(dtype=object), 'weight': weights})
+        cube[field], cube[f"{field}_error"] = _heavy_hitters_update(cube[field], cube[f"{field}_error"], batch)
+
+    points = pd.DataFrame({'cell': cells, 'mean': engagements, 'weight': 1.0})
+    cube["digest"] = _tdigest_compress(pd.concat([cube["digest"], points], ignore_index=True))
+
+
+def finalize_sketch_cube(cube):
+    """Menambahkan tabel sel (dimensi + total eksak per sel); id sel = posisi baris tabel sel."""
+    cells = pd.DataFrame(list(cube["cell_ids"].keys()), columns=CUBE_DIMENSIONS)
+    cube["cells"] = pd.concat([cells, cube["totals"]], axis=1)
+    return cube
+
+
+def build_sketch_cube(df):
+    """Membangun kubus sketsa dalam satu lintasan berpotongan, hanya jika dataset cukup besar."""
+    if len(df) < APPROX_MIN_ROWS:
+        return None
+    cube = new_sketch_cube()
+    for start in range(0, len(df), APPROX_CHUNK_ROWS):
+        update_sketch_cube(cube, df.iloc[start:start + APPROX_CHUNK_ROWS])
+    return finalize_sketch_cube(cube)
+
+
+def _merge_heavy_hitters(cube, field, positions, top_n):
+    """
+    Menggabungkan ringkasan heavy hitters sel terpilih dengan menjumlahkan semua penghitungnya
+    (tanpa pemangkasan ulang), sehingga galat gabungan hanya jumlah galat per sel.
+    """
+    counters = cube[field]
+    selected = counters[counters['cell'].isin(positions)]
+    top = selected.groupby('key')['weight'].sum().nlargest(top_n)
+    return top, float(cube[f"{field}_error"][positions].sum())
+
+
+def query_sketch_cube(cube, start_date, end_date, platform, sentiment, media_type):
+    """
+    Menjawab agregasi dasbor dari kubus sketsa untuk filter yang dipilih.
+    Agregasi per dimensi kubus bersifat eksak; lokasi teratas, jumlah unik dan kuantil
+    keterlibatan bersifat perkiraan dan disertai batas galat.
+    """
+    cells = cube["cells"]
+    mask = (cells['Date'] >= start_date) & (cells['Date'] <= end_date)
+    for column, value in (('Platform', platform), ('Sentiment', sentiment), ('Media Type', media_type)):
+        if value != "All":
+            mask &= cells[column] == value
+    selected = cells[mask]
+    positions = np.flatnonzero(mask.to_numpy())
+
+    top_locations, top_locations_error = _merge_heavy_hitters(cube, "top_locations", positions, 5)
+    top_headlines, top_headlines_error = _merge_heavy_hitters(cube, "top_headlines", positions, 5)
+
+    # Centroid sel terpilih digabung per platform, lalu dimampatkan sekali lagi
+    digest = cube["digest"][cube["digest"]['cell'].isin(positions)]
+    platform_codes, platform_names = pd.factorize(cells['Platform'].to_numpy()[digest['cell'].to_numpy()])
+    platform_digest = _tdigest_compress(digest.assign(cell=platform_codes))
+    quantiles = []
+    for code, platform_centroids in platform_digest.groupby('cell'):
+        platform_centroids = platform_centroids.sort_values('mean')
+        for label, q in (("Median", 0.5), ("P95", 0.95)):
+            value, low, high = _tdigest_quantile(platform_centroids['mean'].to_numpy(), platform_centroids['weight'].to_numpy(), q)
+            quantiles.append({"Platform": platform_names[code], "Kuantil": label, "Perkiraan": value, "Batas Bawah": low, "Batas Atas": high})
+    quantiles = pd.DataFrame(quantiles, columns=["Platform", "Kuantil", "Perkiraan", "Batas Bawah", "Batas Atas"])
+
+    return {
+        "row_count": int(selected['count'].sum()),
+        "inferred_count": int(selected['inferred'].sum()),
+        "sentiment": selected.groupby('Sentiment')['count'].sum().sort_values(ascending=False).reset_index(),
+        "trend": selected.groupby('Date')['Engagements'].sum().reset_index(),
+        "platform": selected.groupby('Platform')['Engagements'].sum().sort_values(ascending=False).reset_index(),
+        "mediaType": selected.groupby('Media Type')['count'].sum().sort_values(ascending=False).reset_index(),
+        "location": top_locations.rename_axis('Location').rename('Engagements').reset_index(),
+        "location_error": top_locations_error,
+        "top_headlines": top_headlines.rename_axis('Headline').rename('count').reset_index(),
+        "top_headlines_error": top_headlines_error,
+        "distinct_headlines": _hll_estimate(_hll_registers(cube["hll_headline"], positions)),
+        "distinct_locations": _hll_estimate(_hll_registers(cube["hll_location"], positions)),
+        "distinct_stories": _hll_estimate(_hll_registers(cube["hll_story"], positions)),
+        "quantiles": quantiles.sort_values(["Platform", "Kuantil"], ignore_index=True),
+    }
+
+
+# --- BACKEND KUERI ---
+# Semua filter dan agregasi dasbor melewati backend kueri. Dataset kecil memakai pandas
+# di memori; dataset besar dialirkan ke DuckDB (penyimpanan kolumnar di disk) sehingga
+# memori yang dipakai tetap terbatas walaupun file lebih besar dari RAM.
+LARGE_DATASET_BYTES = 100 * 1024 * 1024
+LARGE_DATASET_CHUNK_ROWS = 100_000
+DUCKDB_MEMORY_LIMIT = "512MB" # Batas memori DuckDB per dataset; kelebihannya dialihkan ke disk
+# Direktori server berisi CSV besar yang dapat dimuat langsung tanpa unggah lewat browser (opsional)
+LOCAL_DATA_DIR = os.environ.get("MEDIA_INTEL_DATA_DIR")
+# Kolom yang dapat difilter dari sidebar (selain rentang tanggal) dan kunci filternya
+FILTER_COLUMNS = {'Platform': 'platform', 'Sentiment': 'sentiment', 'Media Type': 'media_type', 'Location': 'location'}
+
+
+class PandasBackend:
+    """Backend berbasis DataFrame pandas yang dimuat penuh di memori (perilaku asli dasbor)."""
+
+    name = "pandas"
+
+    def __init__(self, df):
+        self.df = df
+
+    def close(self):
+        """Tidak ada sumber daya eksternal; DataFrame dilepas bersama objek backend."""
+        self.df = None
+
+    def _filter(self, filters):
+        df = self.df
+        if not filters:
+            return df
+        filtered_df = df[
+            (df['Date'].dt.date >= filters['start_date']) &
+            (df['Date'].dt.date <= filters['end_date'])
+        ]
+        for column, key in FILTER_COLUMNS.items():
+            if filters[key] != "All":
+                filtered_df = filtered_df[filtered_df[column] == filters[key]]
+        if filters.get('unique_stories'):
+            # Satu baris per cerita: kemunculan pertama dari setiap klaster sindikasi
+            filtered_df = filtered_df.drop_duplicates('Story Cluster')
+        return filtered_df
+
+    def distinct_values(self, column):
+        return list(self.df[column].unique())
+
+    def date_range(self):
+        return self.df['Date'].min().date(), self.df['Date'].max().date()
+
+    def row_count(self, filters=None):
+        return len(self._filter(filters))
+
+    def inferred_count(self, filters=None):
+        return int(self._filter(filters)['Sentiment Inferred'].sum())
+
+    def mean_engagement(self, filters=None):
+        return self._filter(filters)['Engagements'].mean()
+
+    def nunique(self, filters, column):
+        return int(self._filter(filters)[column].nunique())
+
+    def head(self, filters, n):
+        return self._filter(filters)[DATASET_COLUMNS].head(n)
+
+    def iter_rows(self, filters, batch_size):
+        """Menghasilkan baris terfilter per batch (minimal satu batch, walaupun kosong)."""
+        filtered_df = self._filter(filters)
+        for start in range(0, max(len(filtered_df), 1), batch_size):
+            yield filtered_df.iloc[start:start + batch_size][DATASET_COLUMNS]
+
+    def top_rows(self, filters, n, where=None):
+        """Baris dengan keterlibatan tertinggi; `where` berisi syarat kesetaraan tambahan per kolom."""
+        filtered_df = self._filter(filters)
+        for column, value in (where or {}).items():
+            values = filtered_df['Date'].dt.date if column == 'Date' else filtered_df[column]
+            filtered_df = filtered_df[values == value]
+        return filtered_df[DATASET_COLUMNS].nlargest(n, 'Engagements')
+
+    def value_counts(self, filters, column):
+        counts = self._filter(filters)[column].value_counts().rename_axis(column).reset_index(name='count')
+        return counts.sort_values(['count', column], ascending=[False, True], ignore_index=True)
+
+    def engagement_by(self, filters, column, limit=None):
+        totals = self._filter(filters).groupby(column)['Engagements'].sum().reset_index()
+        totals = totals.sort_values(['Engagements', column], ascending=[False, True], ignore_index=True)
+        return totals.head(limit) if limit else totals
+
+    def daily_engagement(self, filters=None):
+        filtered_df = self._filter(filters)
+        return filtered_df.groupby(filtered_df['Date'].dt.date)['Engagements'].sum().reset_index()
+
+    def engagement_quantiles(self, filters, quantiles):
+        """Kuantil keterlibatan per platform (interpolasi linear), indeks = Platform, kolom = kuantil."""
+        return self._filter(filters).groupby('Platform')['Engagements'].quantile(quantiles).unstack()
+
+    def story_reach(self, filters, top_n):
+        """Mengembalikan (jumlah sebutan, cerita unik, cerita tersindikasi, tabel cerita paling tersindikasi)."""
+        filtered_df = self._filter(filters)
+        mentions = filtered_df.assign(first_row=filtered_df.index).groupby('Story Cluster').agg(
+            Headline=('Headline', 'first'), Sebutan=('Headline', 'size'), first_row=('first_row', 'min'))
+        top = mentions.sort_values(['Sebutan', 'first_row'], ascending=[False, True]).head(top_n)
+        return len(filtered_df), len(mentions), int((mentions['Sebutan'] > 1).sum()), top[['Headline', 'Sebutan']].reset_index(drop=True)
+
+
+def _temp_dir_prefix(kind=""):
+    """Prefiks direktori sementara yang memuat pid proses, agar sisa proses yang mati dapat dikenali."""
+    return f"media_intel_{kind}{os.getpid()}_"
+
+
+@st.cache_resource
+def sweep_stale_temp_dirs():
+    """
+    Menghapus direktori sementara (database & ekspor) milik proses server yang sudah tidak berjalan,
+    mis. setelah crash. Dijalankan sekali per proses server.
+    """
+    if os.name != "posix": # Pemeriksaan pid dengan sinyal 0 hanya aman di POSIX
+        return
+    temp_dir = tempfile.gettempdir()
+    for name in os.listdir(temp_dir):
+        match = re.fullmatch(r"media_intel_(?:export_)?(\d+)_\w+", name)
+        if match is None or int(match.group(1)) == os.getpid():
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(temp_dir, name), ignore_errors=True)
+        except PermissionError:
+            pass # Proses masih berjalan di bawah pengguna lain
+
+
+def _release_database(connection, directory):
+    """Menutup koneksi DuckDB dan menghapus direktori sementara berisi file database."""
+    connection.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class DuckDBBackend:
+    """
+    Backend DuckDB di atas tabel kolumnar di disk. Setiap kueri hanya mengembalikan hasil
+    agregasi (atau beberapa baris), sehingga data penuh tidak pernah dimuat ke memori.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, connection, directory):
+        self.con = connection
+        self.directory = directory
+        # Dijalankan sekali: saat close(), saat backend dibuang bersama sesi yang berakhir, atau saat proses keluar
+        self._release = weakref.finalize(self, _release_database, connection, directory)
+
+    def close(self):
+        """Menutup koneksi dan menghapus direktori sementara berisi file database."""
+        self._release()
+        self.con = None
+
+    def _where(self, filters):
+        if not filters:
+            return "TRUE", []
+        clauses = ["CAST(\"Date\" AS DATE) BETWEEN ? AND ?"]
+        params = [filters['start_date'], filters['end_date']]
+        for column, key in FILTER_COLUMNS.items():
+            if filters[key] != "All":
+                clauses.append(f'"{column}" = ?')
+                params.append(filters[key])
+        where = " AND ".join(clauses)
+        if filters.get('unique_stories'):
+            # Satu baris per cerita: kemunculan pertama dari setiap klaster sindikasi
+            where = f'{where} AND _row IN (SELECT MIN(_row) FROM media WHERE {where} GROUP BY "Story Cluster")'
+            params = params + params
+        return where, params
+
+    def _query(self, sql, filters=None, extra_params=()):
+        where, params = self._where(filters)
+        return self.con.execute(sql.format(where=where), params + list(extra_params))
+
+    def _columns(self):
+        return ", ".join(["_row"] + [f'"{column}"' for column in DATASET_COLUMNS])
+
+    def _rows(self, cursor):
+        # Nomor baris asli dipakai sebagai indeks, sama seperti indeks DataFrame di backend pandas
+        return cursor.df().set_index('_row').rename_axis(None)
+
+    def distinct_values(self, column):
+        # Urutan kemunculan pertama disamakan dengan Series.unique() di pandas
+        return [row[0] for row in self.con.execute(
+            f'SELECT "{column}" FROM media GROUP BY "{column}" ORDER BY MIN(_row)').fetchall()]
+
+    def date_range(self):
+        min_date, max_date = self.con.execute('SELECT MIN("Date"), MAX("Date") FROM media').fetchone()
+        return min_date.date(), max_date.date()
+
+    def row_count(self, filters=None):
+        return self._query("SELECT COUNT(*) FROM media WHERE {where}", filters).fetchone()[0]
+
+    def inferred_count(self, filters=None):
+        return int(self._query('SELECT COUNT(*) FROM media WHERE {where} AND "Sentiment Inferred"', filters).fetchone()[0])
+
+    def mean_engagement(self, filters=None):
+        mean = self._query('SELECT AVG("Engagements") FROM media WHERE {where}', filters).fetchone()[0]
+        return np.nan if mean is None else mean
+
+    def nunique(self, filters, column):
+        return int(self._query(f'SELECT COUNT(DISTINCT "{column}") FROM media WHERE {{where}}', filters).fetchone()[0])
+
+    def head(self, filters, n):
+        return self._rows(self._query(
+            f"SELECT {self._columns()} FROM media WHERE {{where}} ORDER BY _row LIMIT ?", filters, [n]))
+
+    def iter_rows(self, filters, batch_size):
+        """Menghasilkan baris terfilter per batch langsung dari kursor DuckDB (minimal satu batch)."""
+        columns = ", ".join(f'"{column}"' for column in DATASET_COLUMNS)
+        cursor = self._query(f"SELECT {columns} FROM media WHERE {{where}} ORDER BY _row", filters)
+        # DuckDB mengambil data per vektor (2048 baris)
+        vectors_per_batch = max(1, batch_size // 2048)
+        batch = cursor.fetch_df_chunk(vectors_per_batch)
+        yield batch
+        while not batch.empty:
+            batch = cursor.fetch_df_chunk(vectors_per_batch)
+            if not batch.empty:
+                yield batch
+
+    def top_rows(self, filters, n, where=None):
+        """Baris dengan keterlibatan tertinggi; `where` berisi syarat kesetaraan tambahan per kolom."""
+        extra_clauses, extra_params = "", []
+        for column, value in (where or {}).items():
+            extra_clauses += ' AND CAST("Date" AS DATE) = ?' if column == 'Date' else f' AND "{column}" = ?'
+            extra_params.append(value)
+        return self._rows(self._query(
+            f'SELECT {self._columns()} FROM media WHERE {{where}}{extra_clauses} '
+            f'ORDER BY "Engagements" DESC, _row LIMIT ?', filters, extra_params + [n]))
+
+    def value_counts(self, filters, column):
+        return self._query(
+            f'SELECT "{column}", COUNT(*) AS count FROM media WHERE {{where}} '
+            f'GROUP BY "{column}" ORDER BY count DESC, "{column}"', filters).df()
+
+    def engagement_by(self, filters, column, limit=None):
+        limit_clause = f" LIMIT {int(limit)}" if limit else ""
+        return self._query(
+            f'SELECT "{column}", CAST(SUM("Engagements") AS BIGINT) AS "Engagements" FROM media WHERE {{where}} '
+            f'GROUP BY "{column}" ORDER BY "Engagements" DESC, "{column}"{limit_clause}', filters).df()
+
+    def daily_engagement(self, filters=None):
+        daily = self._query(
+            'SELECT CAST("Date" AS DATE) AS "Date", CAST(SUM("Engagements") AS BIGINT) AS "Engagements" '
+            'FROM media WHERE {where} GROUP BY 1 ORDER BY 1', filters).df()
+        daily['Date'] = pd.to_datetime(daily['Date']).dt.date
+        return daily
+
+    def engagement_quantiles(self, filters, quantiles):
+        """Kuantil keterlibatan per platform (interpolasi linear), indeks = Platform, kolom = kuantil."""
+        # DuckDB hanya menerima kuantil konstan, jadi nilainya disisipkan langsung ke SQL
+        quantile_list = ", ".join(str(float(q)) for q in quantiles)
+        result = self._query(
+            f'SELECT "Platform", QUANTILE_CONT("Engagements", [{quantile_list}]) AS q FROM media WHERE {{where}} '
+            f'GROUP BY "Platform" ORDER BY "Platform"', filters).df()
+        values = pd.DataFrame(result['q'].tolist(), index=result['Platform'], columns=list(quantiles))
+        values.columns.name = None
+        return values
+
+    def story_reach(self, filters, top_n):
+        """Mengembalikan (jumlah sebutan, cerita unik, cerita tersindikasi, tabel cerita paling tersindikasi)."""
+        stories_sql = ('SELECT "Story Cluster", COUNT(*) AS mentions, MIN(_row) AS first_row '
+                       'FROM media WHERE {where} GROUP BY "Story Cluster"')
+        mention_count, story_count, syndicated_count = self._query(
+            f'SELECT COALESCE(SUM(mentions), 0), COUNT(*), COUNT(*) FILTER (WHERE mentions > 1) FROM ({stories_sql})',
+            filters).fetchone()
+        top = self._query(
+            f'SELECT m."Headline", s.mentions AS "Sebutan" FROM ({stories_sql}) s JOIN media m ON m._row = s.first_row '
+            f'ORDER BY s.mentions DESC, s.first_row LIMIT ?', filters, [top_n]).df()
+        return int(mention_count), int(story_count), int(syndicated_count), top
+
+
+
+def load_large_csv(uploaded_file):
+    """
+    Mengalirkan CSV besar per potongan ke tabel DuckDB di disk. Setiap potongan dibersihkan,
+    diisi sentimennya dan diindeks judulnya; cerita dikelompokkan di lintasan kedua di DuckDB,
+    lalu kubus sketsa dibangun dari tabel jika dataset cukup besar. Mengembalikan (backend, kubus sketsa).
+    """
+    directory = tempfile.mkdtemp(prefix=_temp_dir_prefix())
+    connection = duckdb.connect(os.path.join(directory, "media.duckdb"), config={
+        "memory_limit": DUCKDB_MEMORY_LIMIT, "temp_directory": os.path.join(directory, "spill"),
+        "preserve_insertion_order": False, # Urutan baris dijaga lewat kolom _row, bukan oleh DuckDB
+    })
+    backend = DuckDBBackend(connection, directory)
+    con = backend.con
+    try:
+        con.execute(
+            'CREATE TABLE media (_row BIGINT, "Date" TIMESTAMP, "Engagements" BIGINT, "Platform" VARCHAR, '
+            '"Sentiment" VARCHAR, "Media Type" VARCHAR, "Location" VARCHAR, "Headline" VARCHAR, "Sentiment Inferred" BOOLEAN, '
+            '"Story Cluster" BIGINT)'
+        )
+        uploaded_file.seek(0)
+        reader = pd.read_csv(io.TextIOWrapper(uploaded_file, encoding="utf-8"), chunksize=LARGE_DATASET_CHUNK_ROWS)
+        for chunk in reader:
+            chunk = clean_media_frame(chunk)
+            add_story_headlines(con, chunk)
+            # 'Story Cluster' dibiarkan NULL sampai cluster_stories dijalankan
+            batch = chunk[DATASET_COLUMNS[:-1]].reset_index(names='_row')
+            con.register('batch', batch)
+            con.execute("INSERT INTO media BY NAME SELECT * FROM batch")
+            con.unregister('batch')
+        cluster_stories(con)
+        # Sama seperti build_sketch_cube: kubus hanya dibangun jika dataset cukup besar. Kubus
+        # dibangun dari tabel di disk setelah cerita diketahui, sehingga semua sketsa lengkap.
+        if backend.row_count() < APPROX_MIN_ROWS:
+            return backend, None
+        cube = new_sketch_cube()
+        columns = ", ".join(f'"{column}"' for column in DATASET_COLUMNS)
+        for batch in con.execute(f"SELECT {columns} FROM media").fetch_record_batch(LARGE_DATASET_CHUNK_ROWS):
+            update_sketch_cube(cube, batch.to_pandas())
+        cube = finalize_sketch_cube(cube)
+    except Exception:
+        # File database sementara dibuang jika pemuatan gagal di tengah jalan
+        backend.close()
+        raise
+    return backend, cube
+
+
+def load_dataset(uploaded_file):
+    """
+    Memilih backend berdasarkan ukuran file: pandas untuk file kecil, DuckDB untuk file besar
+    (jika paket duckdb terpasang). Mengembalikan (backend, kubus sketsa) atau (None, None).
+    """
+    if uploaded_file.size > LARGE_DATASET_BYTES and duckdb is not None:
+        try:
+            return load_large_csv(uploaded_file)
+        except Exception as e:
+            st.error(f"Gagal memproses file CSV. Pastikan formatnya benar. Error: {e}")
+            return None, None
+    df = parse_csv(uploaded_file)
+    if df is None:
+        return None, None
+    return PandasBackend(df), build_sketch_cube(df)
+
+
+def load_local_csv(path):
+    """
+    Memuat CSV dari disk server langsung ke backend DuckDB. File dibaca per potongan dari disk,
+    sehingga tidak dibatasi ukuran unggah Streamlit maupun RAM. Mengembalikan (backend, kubus sketsa).
+    """
+    try:
+        with open(path, "rb") as f:
+            return load_large_csv(f)
+    except Exception as e:
+        st.error(f"Gagal memproses file CSV. Pastikan formatnya benar. Error: {e}")
+        return None, None
+
+# --- EKSPOR DATA ---
+# Data terfilter dan agregat grafik diekspor per batch langsung ke file di disk (tanpa salinan
+# penuh di memori), lalu file tersebut dipakai ulang selama dataset dan filter tidak berubah.
+EXPORT_BATCH_ROWS = 100_000
+EXPORT_CACHE_MAX_FILES = 20
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/vnd.apache.parquet")}
+
+
+def chart_aggregate(backend, filters, key):
+    """Agregat eksak di balik setiap grafik dasbor, dihitung oleh backend kueri."""
+    if key == "sentiment":
+        return backend.value_counts(filters, 'Sentiment')
+    if key == "trend":
+        return backend.daily_engagement(filters)
+    if key == "platform":
+        return backend.engagement_by(filters, 'Platform')
+    if key == "mediaType":
+        return backend.value_counts(filters, 'Media Type')
+    if key == "location":
+        return backend.engagement_by(filters, 'Location', limit=5)
+    raise ValueError(f"Agregat grafik tidak dikenal: {key}")
+
+
+def iter_export_batches(backend, filters, artifact):
+    """Generator batch DataFrame untuk diekspor: baris terfilter ('rows') atau agregat satu grafik."""
+    if artifact == "rows":
+        yield from backend.iter_rows(filters, EXPORT_BATCH_ROWS)
+    else:
+        yield chart_aggregate(backend, filters, artifact)
+
+
+def write_export(batches, path, export_format):
+    """Menserialisasi setiap batch langsung ke `path`; hanya satu batch yang ada di memori pada satu waktu."""
+    if export_format == "CSV":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for i, batch in enumerate(batches):
+                batch.to_csv(f, header=(i == 0), index=False)
+        return
+
+    writer = None
+    try:
+        for batch in batches:
+            # Skema batch pertama dipakai untuk semua batch berikutnya
+            table = pa.Table.from_pandas(batch, schema=writer.schema if writer else None, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+@st.cache_resource
+def get_export_cache():
+    """Direktori dan indeks file ekspor bersama: kunci (id unggahan, filter, artefak, format) -> path."""
+    return {"dir": tempfile.mkdtemp(prefix=_temp_dir_prefix("export_")), "files": {}, "lock": threading.Lock()}
+
+
+def get_cached_export(cache_key):
+    """Mengembalikan path file ekspor yang sudah ada untuk `cache_key`, atau None."""
+    cache = get_export_cache()
+    with cache["lock"]:
+        path = cache["files"].pop(cache_key, None)
+        if path is not None:
+            cache["files"][cache_key] = path # Pindahkan ke akhir: yang paling lama tidak dipakai dihapus lebih dulu
+    return path if path and os.path.exists(path) else None
+
+
+def create_export(backend, filters, artifact, export_format, cache_key):
+    """Menulis file ekspor baru dan mendaftarkannya di cache; file yang paling lama tidak dipakai dihapus jika cache penuh."""
+    cache = get_export_cache()
+    extension = EXPORT_FORMATS[export_format][0]
+    path = os.path.join(cache["dir"], f"{uuid.uuid4().hex}.{extension}")
+    write_export(iter_export_batches(backend, filters, artifact), path, export_format)
+    with cache["lock"]:
+        cache["files"][cache_key] = path
+        while len(cache["files"]) > EXPORT_CACHE_MAX_FILES:
+            oldest_path = cache["files"].pop(next(iter(cache["files"])))
+            if os.path.exists(oldest_path):
+                os.remove(oldest_path)
+    return path
+
+
+def read_export(backend, filters, artifact, export_format, cache_key):
+    """
+    Membaca isi file ekspor saat tombol unduh diklik. Jika file sudah dikeluarkan dari cache
+    bersama oleh sesi lain sejak tombol ditampilkan, file dibuat ulang.
+    """
+    path = get_cached_export(cache_key)
+    if path is not None:
+        try:
+            with open(path, "rb") as export_file:
+                return export_file.read()
+        except FileNotFoundError:
+            pass # Dihapus sesi lain di antara pencarian dan pembukaan file
+    with open(create_export(backend, filters, artifact, export_format, cache_key), "rb") as export_file:
+        return export_file.read()
+
+
+def discard_exports(dataset_id):
+    """Menghapus semua file ekspor milik satu unggahan dari cache dan dari disk."""
+    cache = get_export_cache()
+    with cache["lock"]:
+        paths = [cache["files"].pop(key) for key in list(cache["files"]) if key[0] == dataset_id]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
 # --- UI STREAMLIT ---
 load_css()
 api_configured = configure_gemini_api() # Panggil fungsi konfigurasi API di awal
+sweep_stale_temp_dirs() # Bersihkan database sementara sisa proses server sebelumnya
 
 # Header Utama
 st.markdown("""
@@ -425,6 +1619,10 @@ if 'last_uploaded_file_name' not in st.session_state: # Tambahkan inisialisasi u
     st.session_state.last_uploaded_file_name = None
 if 'last_uploaded_file_size' not in st.session_state: # Tambahkan inisialisasi untuk ukuran file
     st.session_state.last_uploaded_file_size = None
+if 'sketch_cube' not in st.session_state: # Kubus sketsa untuk mode analitik perkiraan
+    st.session_state.sketch_cube = None
+if 'dataset_id' not in st.session_state: # Id unik per unggahan, dipakai sebagai kunci cache ekspor
+    st.session_state.dataset_id = None
 
 
 # Tampilan unggah file (hanya muncul jika data belum diunggah)
@@ -440,20 +1638,49 @@ if st.session_state.data is None:
                 # Periksa apakah file yang diunggah sama dengan yang terakhir kali diproses
                 # Ini penting untuk menghindari pemrosesan ulang saat widget file_uploader mempertahankan nilainya
                 if uploaded_file.name != st.session_state.last_uploaded_file_name or uploaded_file.size != st.session_state.last_uploaded_file_size:
-                    st.session_state.data = parse_csv(uploaded_file)
+                    # Backend kueri dipilih otomatis berdasarkan ukuran file; kubus sketsa dibangun dalam lintasan yang sama
+                    st.session_state.data, st.session_state.sketch_cube = load_dataset(uploaded_file)
                     if st.session_state.data is not None:
                         # Simpan detail file
+                        st.session_state.dataset_id = uuid.uuid4().hex
                         st.session_state.last_uploaded_file_name = uploaded_file.name
                         st.session_state.last_uploaded_file_size = uploaded_file.size
                         st.rerun() # PERBAIKAN: Memaksa rerun untuk menyembunyikan bagian unggah dan menampilkan dashboard
                 # else:
                 #     st.info("File ini sudah diunggah dan dianalisis.") # Opsional: pesan jika file yang sama diunggah ulang
+
+            # File yang diunggah lewat browser selalu disimpan utuh di memori dan dibatasi server.maxUploadSize.
+            # File yang lebih besar dari itu (atau dari RAM) hanya dapat dimuat dari direktori data server.
+            if LOCAL_DATA_DIR and duckdb is not None and os.path.isdir(LOCAL_DATA_DIR):
+                local_files = sorted(name for name in os.listdir(LOCAL_DATA_DIR) if name.lower().endswith(".csv"))
+                local_file = st.selectbox("Atau pilih file CSV besar di server", [""] + local_files, key="local_file_select")
+                if local_file and st.button("Muat File Server", key="load_local_file_btn"):
+                    local_path = os.path.join(LOCAL_DATA_DIR, local_file)
+                    with st.spinner("Memuat file server per potongan..."):
+                        st.session_state.data, st.session_state.sketch_cube = load_local_csv(local_path)
+                    if st.session_state.data is not None:
+                        st.session_state.dataset_id = uuid.uuid4().hex
+                        st.session_state.last_uploaded_file_name = local_file
+                        st.session_state.last_uploaded_file_size = os.path.getsize(local_path)
+                        st.rerun()
+            else:
+                st.caption(
+                    f"Unggahan dibatasi {st.get_option('server.maxUploadSize')} MB dan disimpan utuh di memori. "
+                    "File yang lebih besar belum dapat dipakai kecuali administrator mengatur MEDIA_INTEL_DATA_DIR."
+                )
             st.markdown('</div>', unsafe_allow_html=True)
 
 
 # Tampilan Dasbor Utama (setelah file diunggah)
 if st.session_state.data is not None:
-    df = st.session_state.data
+    backend = st.session_state.data
+    sketch_cube = st.session_state.sketch_cube
+
+    # Total baris & sentimen terinferensi tersedia eksak di tabel sel kubus, tanpa memindai data
+    if sketch_cube is not None:
+        total_rows, total_inferred = int(sketch_cube["cells"]['count'].sum()), int(sketch_cube["cells"]['inferred'].sum())
+    else:
+        total_rows, total_inferred = backend.row_count(), backend.inferred_count()
 
     # Menampilkan informasi file yang terunggah dan tombol hapus
     st.markdown(f"""
@@ -461,17 +1688,23 @@ if st.session_state.data is not None:
             <h3>☁️ File Terunggah</h3>
             <p><strong>Nama File:</strong> {st.session_state.last_uploaded_file_name}</p>
             <p><strong>Ukuran File:</strong> {st.session_state.last_uploaded_file_size / (1024 * 1024):.2f} MB</p>
+            <p><strong>Sentimen Diinferensi:</strong> {total_inferred:,} dari {total_rows:,} baris</p>
+            <p><strong>Backend Kueri:</strong> {backend.name}</p>
             <p style="color: #5eead4; font-weight: bold;">File CSV berhasil diunggah dan diproses!</p>
     """, unsafe_allow_html=True)
     
     if st.button("Hapus File Terunggah", key="clear_file_btn"):
+        backend.close() # Tutup koneksi DuckDB dan hapus file sementaranya
+        discard_exports(st.session_state.dataset_id)
         st.session_state.data = None # Hapus data
+        st.session_state.sketch_cube = None
         st.session_state.chart_insights = {} # Bersihkan wawasan
         st.session_state.campaign_summary = ""
         st.session_state.post_idea = ""
         st.session_state.anomaly_insight = ""
         st.session_state.chart_figures = {}
-        st.session_state.last_filter_state = "" # Reset filter state
+        st.session_state.last_filter_state = None # Reset filter state
+        st.session_state.dataset_id = None
         st.session_state.last_uploaded_file_name = None # Hapus info file
         st.session_state.last_uploaded_file_size = None # Hapus info file
         st.rerun() # Rerun aplikasi untuk menampilkan kembali bagian upload
@@ -486,17 +1719,20 @@ if st.session_state.data is not None:
     with st.sidebar:
         st.markdown("<h3><i class='fas fa-filter'></i> Filter Data</h3>", unsafe_allow_html=True)
 
-        platform = st.selectbox("Platform", ["All"] + list(df['Platform'].unique()), key='platform_filter')
-        sentiment = st.selectbox("Sentiment", ["All"] + list(df['Sentiment'].unique()), key='sentiment_filter')
-        media_type = st.selectbox("Media Type", ["All"] + list(df['Media Type'].unique()), key='media_type_filter')
-        location = st.selectbox("Location", ["All"] + list(df['Location'].unique()), key='location_filter')
+        platform = st.selectbox("Platform", ["All"] + backend.distinct_values('Platform'), key='platform_filter')
+        sentiment = st.selectbox("Sentiment", ["All"] + backend.distinct_values('Sentiment'), key='sentiment_filter')
+        media_type = st.selectbox("Media Type", ["All"] + backend.distinct_values('Media Type'), key='media_type_filter')
+        location = st.selectbox("Location", ["All"] + backend.distinct_values('Location'), key='location_filter')
 
-        min_date, max_date = df['Date'].min().date(), df['Date'].max().date()
+        min_date, max_date = backend.date_range()
         start_date = st.date_input("Tanggal Mulai", min_date, min_value=min_date, max_value=max_date, key='start_date_filter')
         end_date = st.date_input("Tanggal Akhir", max_date, min_value=min_date, max_value=max_date, key='end_date_filter')
         
+        unique_stories = st.checkbox("Hanya cerita unik (gabungkan sindikasi)", key='unique_stories_filter',
+                                     help="Menghitung berita yang sama dari banyak media sebagai satu cerita.")
+
         # Logika reset insight jika filter berubah
-        filter_state = f"{platform}{sentiment}{media_type}{location}{start_date}{end_date}"
+        filter_state = (platform, sentiment, media_type, location, start_date, end_date, unique_stories)
         if 'last_filter_state' not in st.session_state or st.session_state.last_filter_state != filter_state:
             st.session_state.chart_insights = {}
             st.session_state.campaign_summary = ""
@@ -505,20 +1741,63 @@ if st.session_state.data is not None:
             st.session_state.chart_figures = {} # Reset chart figures juga
             st.session_state.last_filter_state = filter_state
 
+        # Mode analitik perkiraan berbasis sketsa
+        st.markdown("<h3>📐 Mode Analitik</h3>", unsafe_allow_html=True)
+        approx_mode = st.checkbox(
+            "Gunakan mode perkiraan (sketsa)", key='approx_mode_toggle', disabled=sketch_cube is None,
+            help="Menjawab grafik dari sketsa yang dibangun saat unggah, bukan dari seluruh baris data." if sketch_cube is not None
+            else f"Tersedia untuk dataset dengan minimal {APPROX_MIN_ROWS:,} baris; di bawah itu hasil eksak sudah cepat.")
+        compare_exact = st.checkbox("Bandingkan dengan hasil eksak", key='approx_compare_toggle', disabled=not approx_mode)
+
+        # Status antrean AI bersama, agar pengguna tahu mengapa permintaan menunggu
+        st.markdown("<h3>🤖 Antrean AI</h3>", unsafe_allow_html=True)
+        queue_status = get_llm_scheduler().status()
+        st.caption(
+            f"Permintaan dalam antrean: {queue_status['depth']} · "
+            f"Rata-rata tunggu: {queue_status['avg_wait']:.1f} detik · "
+            f"Perkiraan tunggu berikutnya: {queue_status['next_wait']:.0f} detik"
+        )
+
+
+    # Filter aktif, diteruskan ke backend kueri untuk setiap agregasi
+    filters = {
+        'start_date': start_date, 'end_date': end_date,
+        'platform': platform, 'sentiment': sentiment, 'media_type': media_type, 'location': location,
+        'unique_stories': unique_stories,
+    }
 
-    # Filter DataFrame
-    filtered_df = df[
-        (df['Date'].dt.date >= start_date) &
-        (df['Date'].dt.date <= end_date)
-    ]
-    if platform != "All":
-        filtered_df = filtered_df[filtered_df['Platform'] == platform]
-    if sentiment != "All":
-        filtered_df = filtered_df[filtered_df['Sentiment'] == sentiment]
-    if media_type != "All":
-        filtered_df = filtered_df[filtered_df['Media Type'] == media_type]
-    if location != "All":
-        filtered_df = filtered_df[filtered_df['Location'] == location]
+    # --- Analitik Perkiraan ---
+    # Dihitung lebih dulu agar cakupan cerita, deteksi anomali dan grafik dapat dijawab dari kubus
+    approx_results = None
+    if approx_mode and sketch_cube is not None:
+        if location != "All" or unique_stories:
+            # Lokasi dan cerita bukan dimensi kubus, jadi filter ini hanya bisa dijawab secara eksak
+            st.warning("Mode perkiraan tidak mendukung filter Lokasi atau cerita unik. Menampilkan hasil eksak.")
+        else:
+            approx_results = query_sketch_cube(sketch_cube, start_date, end_date, platform, sentiment, media_type)
+
+    # --- Cakupan Cerita & Sindikasi ---
+    # Jangkauan dihitung dari semua sebutan, terlepas dari toggle cerita unik
+    if approx_results is not None:
+        mention_count = approx_results["row_count"]
+        story_count, story_count_error = approx_results["distinct_stories"]
+        syndicated_count, top_stories = None, None
+    else:
+        mention_count, story_count, syndicated_count, top_stories = backend.story_reach(dict(filters, unique_stories=False), 5)
+    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+    st.markdown("<h3>📰 Cakupan Cerita</h3>", unsafe_allow_html=True)
+    story_cols = st.columns(3)
+    story_cols[0].metric("Total Sebutan", f"{mention_count:,}")
+    if approx_results is not None:
+        story_cols[1].metric("Cerita Unik (perkiraan)", f"{story_count:,} ± {story_count_error:,}")
+    else:
+        story_cols[1].metric("Cerita Unik", f"{story_count:,}", help=f"{syndicated_count:,} cerita dimuat oleh lebih dari satu media.")
+    story_cols[2].metric("Jangkauan Sindikasi", f"{mention_count / story_count:.2f}x" if story_count else "-",
+                         help="Rata-rata jumlah sebutan per cerita unik.")
+    if syndicated_count:
+        st.write("Cerita yang paling banyak disindikasi:")
+        st.dataframe(top_stories, use_container_width=True, hide_index=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
     # --- Pusat Wawasan AI ---
     st.markdown('<div class="insight-hub">', unsafe_allow_html=True)
@@ -532,11 +1811,13 @@ if st.session_state.data is not None:
                 prompt = f"""
                 Anda adalah seorang konsultan strategi media senior. Analisis data kampanye berikut secara komprehensif. Berikan ringkasan eksekutif (3-4 kalimat) diikuti oleh 3 rekomendasi strategis utama yang paling berdampak. 
                 Gunakan data berikut:
-                - Data yang difilter (5 baris pertama): {filtered_df.head().to_json()}
-                - Jumlah total sebutan: {len(filtered_df)}
-                - Rata-rata keterlibatan: {filtered_df['Engagements'].mean():.2f}
-                - Distribusi Sentimen: {filtered_df['Sentiment'].value_counts().to_json()}
-                - Keterlibatan per Platform: {filtered_df.groupby('Platform')['Engagements'].sum().to_json()}
+                - Data yang difilter (5 baris pertama): {backend.head(filters, 5).to_json()}
+                - Jumlah total sebutan: {mention_count}
+                - Jumlah cerita unik (setelah menggabungkan liputan sindikasi): {story_count}
+                - Rata-rata keterlibatan: {backend.mean_engagement(filters):.2f}
+                - Distribusi Sentimen: {backend.value_counts(filters, 'Sentiment').set_index('Sentiment')['count'].to_json()}
+                - Jumlah sentimen yang diinferensi otomatis dari judul (bukan label asli): {backend.inferred_count(filters)}
+                - Keterlibatan per Platform: {backend.engagement_by(filters, 'Platform').set_index('Platform')['Engagements'].to_json()}
                 Fokus pada gambaran besar: Apa cerita utama yang disampaikan oleh data ini? Di mana peluang terbesar dan apa risiko utamanya? Format jawaban Anda dengan jelas.
                 """
                 summary = get_ai_insight(prompt)
@@ -548,11 +1829,11 @@ if st.session_state.data is not None:
         st.markdown("<h4>💡 Generator Ide Konten AI</h4>", unsafe_allow_html=True)
         if st.button("✨ Buat Ide Postingan", key="idea_btn", use_container_width=True):
             with st.spinner("Mencari ide terbaik..."):
-                if not filtered_df.empty:
-                    best_platform_series = filtered_df.groupby('Platform')['Engagements'].sum()
-                    if not best_platform_series.empty:
-                        best_platform = best_platform_series.idxmax()
-                        top_posts = filtered_df[filtered_df['Platform'] == best_platform].nlargest(5, 'Engagements')
+                if backend.row_count(filters) > 0:
+                    best_platform_data = backend.engagement_by(filters, 'Platform', limit=1)
+                    if not best_platform_data.empty:
+                        best_platform = best_platform_data['Platform'].iloc[0]
+                        top_posts = backend.top_rows(filters, 5, where={'Platform': best_platform})
                         top_headlines = ', '.join(top_posts['Headline'].tolist())
                     else:
                         best_platform = "tidak diketahui"
@@ -581,7 +1862,7 @@ if st.session_state.data is not None:
     st.markdown('</div>', unsafe_allow_html=True)
 
     # --- Deteksi Anomali ---
-    engagement_trend = filtered_df.groupby(filtered_df['Date'].dt.date)['Engagements'].sum().reset_index()
+    engagement_trend = approx_results["trend"] if approx_results is not None else backend.daily_engagement(filters)
     if len(engagement_trend) > 7:
         mean = engagement_trend['Engagements'].mean()
         std = engagement_trend['Engagements'].std()
@@ -599,8 +1880,8 @@ if st.session_state.data is not None:
             
             if st.button("✨ Jelaskan Anomali Ini", key="anomaly_btn"):
                 with st.spinner("Menganalisis penyebab anomali..."):
-                    anomaly_day_data = filtered_df[filtered_df['Date'].dt.date == anomaly['Date']]
-                    top_headlines_on_anomaly_day = ', '.join(anomaly_day_data.nlargest(3, 'Engagements')['Headline'].tolist())
+                    anomaly_day_data = backend.top_rows(filters, 3, where={'Date': anomaly['Date']})
+                    top_headlines_on_anomaly_day = ', '.join(anomaly_day_data['Headline'].tolist())
 
                     prompt = f"""
                     Anda adalah seorang analis data intelijen media. Terdeteksi anomali keterlibatan pada {anomaly['Date']}.
@@ -617,6 +1898,40 @@ if st.session_state.data is not None:
             st.markdown('</div>', unsafe_allow_html=True)
 
 
+    # --- Statistik Perkiraan ---
+    if approx_results is not None:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown("<h3>📐 Statistik Perkiraan</h3>", unsafe_allow_html=True)
+        distinct_headlines, distinct_headlines_error = approx_results["distinct_headlines"]
+        distinct_locations, distinct_locations_error = approx_results["distinct_locations"]
+        stat_cols = st.columns(2)
+        stat_cols[0].metric("Judul Unik (perkiraan)", f"{distinct_headlines:,} ± {distinct_headlines_error:,}")
+        stat_cols[1].metric("Lokasi Unik (perkiraan)", f"{distinct_locations:,} ± {distinct_locations_error:,}")
+        st.write("Kuantil keterlibatan per platform (t-digest):")
+        st.dataframe(approx_results["quantiles"], use_container_width=True, hide_index=True)
+        top_headlines = approx_results["top_headlines"]
+        # Peringkat hanya bermakna jika batas galat lebih kecil dari nilai yang ditampilkan
+        if not top_headlines.empty and approx_results['top_headlines_error'] < top_headlines['count'].min():
+            st.write(f"Judul paling sering muncul (jumlah sebenarnya dapat lebih tinggi hingga {approx_results['top_headlines_error']:,.0f}):")
+            st.dataframe(top_headlines, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Judul paling sering muncul tidak ditampilkan: batas galat sketsa melebihi jumlah yang diperkirakan.")
+
+        if compare_exact:
+            exact_quantiles = backend.engagement_quantiles(filters, [0.5, 0.95])
+            comparison = approx_results["quantiles"].copy()
+            comparison['Eksak'] = [
+                exact_quantiles.loc[row['Platform'], 0.5 if row['Kuantil'] == "Median" else 0.95]
+                for _, row in comparison.iterrows()
+            ]
+            st.write("Perbandingan dengan hasil eksak:")
+            st.dataframe(pd.DataFrame([
+                {"Metrik": "Judul Unik", "Perkiraan": distinct_headlines, "Batas Galat": distinct_headlines_error, "Eksak": backend.nunique(filters, 'Headline')},
+                {"Metrik": "Lokasi Unik", "Perkiraan": distinct_locations, "Batas Galat": distinct_locations_error, "Eksak": backend.nunique(filters, 'Location')},
+            ]), use_container_width=True, hide_index=True)
+            st.dataframe(comparison, use_container_width=True, hide_index=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
     # --- Tampilan Grafik ---
     chart_cols = st.columns(2)
     
@@ -655,14 +1970,19 @@ if st.session_state.data is not None:
             chart_data_for_prompt = None
 
             if chart["key"] == "sentiment":
-                sentiment_data = filtered_df['Sentiment'].value_counts().reset_index()
-                sentiment_data.columns = ['Sentiment', 'count']
+                if approx_results is not None:
+                    sentiment_data = approx_results["sentiment"]
+                else:
+                    sentiment_data = chart_aggregate(backend, filters, "sentiment")
                 if not sentiment_data.empty:
                     fig = px.pie(sentiment_data, names='Sentiment', values='count', color_discrete_sequence=px.colors.qualitative.Pastel)
                 chart_data_for_prompt = sentiment_data.to_json()
 
             elif chart["key"] == "trend":
-                engagement_trend_chart = filtered_df.groupby(filtered_df['Date'].dt.date)['Engagements'].sum().reset_index()
+                if approx_results is not None:
+                    engagement_trend_chart = approx_results["trend"].copy()
+                else:
+                    engagement_trend_chart = chart_aggregate(backend, filters, "trend")
                 engagement_trend_chart['Date'] = pd.to_datetime(engagement_trend_chart['Date'])
                 if not engagement_trend_chart.empty:
                     fig = px.line(engagement_trend_chart, x='Date', y='Engagements', labels={'Date': 'Tanggal', 'Engagements': 'Total Keterlibatan'})
@@ -670,14 +1990,19 @@ if st.session_state.data is not None:
                 chart_data_for_prompt = engagement_trend_chart.tail(10).to_json()
                 
             elif chart["key"] == "platform":
-                platform_data = filtered_df.groupby('Platform')['Engagements'].sum().sort_values(ascending=False).reset_index()
+                if approx_results is not None:
+                    platform_data = approx_results["platform"]
+                else:
+                    platform_data = chart_aggregate(backend, filters, "platform")
                 if not platform_data.empty:
                     fig = px.bar(platform_data, x='Platform', y='Engagements', color='Platform')
                 chart_data_for_prompt = platform_data.to_json()
 
             elif chart["key"] == "mediaType":
-                media_type_data = filtered_df['Media Type'].value_counts().reset_index()
-                media_type_data.columns = ['Media Type', 'count']
+                if approx_results is not None:
+                    media_type_data = approx_results["mediaType"]
+                else:
+                    media_type_data = chart_aggregate(backend, filters, "mediaType")
                 if not media_type_data.empty:
                     fig = px.pie(media_type_data, names='Media Type', values='count', hole=.3,
                                  color_discrete_map={
@@ -689,9 +2014,24 @@ if st.session_state.data is not None:
                 chart_data_for_prompt = media_type_data.to_json()
 
             elif chart["key"] == "location": 
-                location_data = filtered_df.groupby('Location')['Engagements'].sum().nlargest(5).reset_index()
+                approx_location = approx_results is not None and not approx_results["location"].empty
+                if approx_location and approx_results["location_error"] >= approx_results["location"]['Engagements'].min():
+                    # Batas galat melebihi nilai yang diperkirakan, jadi peringkat perkiraan tidak bermakna
+                    st.caption("Galat sketsa lokasi terlalu besar untuk filter ini; menampilkan hasil eksak.")
+                    approx_location = False
+                if approx_location:
+                    location_data = approx_results["location"]
+                    # Misra-Gries hanya bisa meremehkan: nilai sebenarnya ada di [perkiraan, perkiraan + galat]
+                    st.caption(f"Perkiraan: total keterlibatan sebenarnya dapat lebih tinggi hingga {approx_results['location_error']:,.0f}.")
+                    if compare_exact:
+                        st.dataframe(
+                            backend.engagement_by(filters, 'Location', limit=5).rename(columns={'Engagements': 'Eksak'}),
+                            use_container_width=True, hide_index=True)
+                else:
+                    location_data = chart_aggregate(backend, filters, "location")
                 if not location_data.empty:
-                    fig = px.bar(location_data, y='Location', x='Engagements', orientation='h', color='Location')
+                    fig = px.bar(location_data, y='Location', x='Engagements', orientation='h', color='Location',
+                                 labels={'Engagements': 'Keterlibatan (perkiraan, batas bawah)'} if approx_location else None)
                 chart_data_for_prompt = location_data.to_json()
             
             if fig: # Hanya tampilkan grafik jika ada data untuk dibuat
@@ -710,10 +2050,10 @@ if st.session_state.data is not None:
                     with st.spinner(f"Menganalisis {chart['title']} dan membuat wawasan..."):
                         if chart_data_for_prompt:
                             prompt_v1 = get_chart_prompt(chart['key'], chart_data_for_prompt, "Versi 1")
-                            insight_v1 = get_ai_insight(prompt_v1)
+                            insight_v1 = get_ai_insight(prompt_v1, PRIORITY_BATCH)
                             
                             prompt_v2 = get_chart_prompt(chart['key'], chart_data_for_prompt, "Versi 2")
-                            insight_v2 = get_ai_insight(prompt_v2)
+                            insight_v2 = get_ai_insight(prompt_v2, PRIORITY_BATCH)
                             
                             st.session_state.chart_insights[chart['key']] = {
                                 "gemini-2.0-flash": insight_v1,
@@ -795,3 +2135,37 @@ if st.session_state.data is not None:
                 st.success("Laporan HTML siap diunduh! Buka file ini di browser Anda, lalu gunakan fitur cetak browser untuk menyimpannya sebagai PDF jika diperlukan.")
             else:
                 st.error("Gagal membuat laporan HTML. Pastikan semua grafik telah dibuat atau ada data.")
+
+    # --- Bagian Ekspor Data ---
+    st.markdown("---")
+    st.markdown("<h3>📦 Ekspor Data & Agregat</h3>", unsafe_allow_html=True)
+
+    export_artifacts = {"rows": "Data Terfilter (semua baris)"}
+    export_artifacts.update({chart_info["key"]: f"Agregat: {chart_info['title']}" for chart_info in charts_to_display})
+    export_cols = st.columns(2)
+    with export_cols[0]:
+        export_artifact = st.selectbox("Data yang diekspor", list(export_artifacts), format_func=export_artifacts.get, key="export_artifact")
+    with export_cols[1]:
+        export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+
+    # File ekspor dipakai ulang selama unggahan, filter, artefak dan format sama. Id unggahan
+    # unik per sesi, sehingga sesi lain dengan file bernama sama tidak pernah mendapat file ini.
+    export_cache_key = (st.session_state.dataset_id, st.session_state.last_filter_state, export_artifact, export_format)
+    export_path = get_cached_export(export_cache_key)
+    if export_path is None and st.button("Siapkan Ekspor", key="prepare_export_btn", use_container_width=True):
+        with st.spinner("Menulis file ekspor per batch..."):
+            try:
+                export_path = create_export(backend, filters, export_artifact, export_format, export_cache_key)
+            except Exception as e:
+                st.error(f"Gagal membuat file ekspor. Error: {e}")
+
+    if export_path is not None:
+        extension, mime = EXPORT_FORMATS[export_format]
+        # File baru dibaca saat tombol diklik, bukan di setiap rerun; dibuat ulang jika sudah dikeluarkan dari cache
+        st.download_button(
+            label=f"Unduh {export_artifacts[export_artifact]} ({export_format})",
+            data=lambda args=(backend, dict(filters), export_artifact, export_format, export_cache_key): read_export(*args),
+            file_name=f"Media_Intelligence_{export_artifact}.{extension}",
+            mime=mime,
+            key="actual_download_button_export"
+        )